@@ -3,11 +3,13 @@ The classic game of flappy bird. Make with python
 and pygame. Features pixel perfect collision using masks
 """
 
+import functools
 import os
 import random
 import time
 
 import neat
+import numpy as np
 import pygame
 
 pygame.font.init() # init font
@@ -18,13 +20,35 @@ WIN_HEIGHT = 800
 # Generations
 GEN = 0
 
+# Only every RENDER_EVERY generations is drawn, the rest run headless at full speed
+RENDER_EVERY = 10
+
+# Ticks played over the whole run, headless generations check the window every 100.
+# Kept across generations, short ones would never get to 100 on their own
+TICKS = 0
+
+# Seed of the pipe course of eval_genomes. The whole run trains on this one course,
+# so a genome that comes back unchanged (like the elites) scores the same fitness again.
+# With PARALLEL the course changes every generation instead
+PIPE_SEED = 0
+
+# Fitness of the genomes already simulated, keyed by genome_key
+FITNESS_CACHE = {}
+
+# If the drawn images were already converted to the window's pixel format
+IMAGES_CONVERTED = False
+
+# Evaluate every genome on its own headless game, spread over the cpu cores
+PARALLEL = False
+
 # Getting the images of the birds in a list, with their size doubled
 BIRD_IMGS = [pygame.transform.scale2x(pygame.image.load(os.path.join("imgs", "bird1.png"))),
             pygame.transform.scale2x(pygame.image.load(os.path.join("imgs", "bird2.png"))),
             pygame.transform.scale2x(pygame.image.load(os.path.join("imgs", "bird3.png")))]
 
-# Getting the image of the pipe
+# Getting the image of the pipe, and flipped for the top pipe
 PIPE_IMG = pygame.transform.scale2x(pygame.image.load(os.path.join("imgs", "pipe.png")))
+PIPE_TOP_IMG = pygame.transform.flip(PIPE_IMG, False, True)
 
 # Getting the image of the base
 BASE_IMG = pygame.transform.scale2x(pygame.image.load(os.path.join("imgs", "base.png")))
@@ -34,6 +58,50 @@ BG_IMG = pygame.transform.scale2x(pygame.image.load(os.path.join("imgs", "bg.png
 
 STAT_FONT = pygame.font.SysFont("comicsans", 50)
 
+# Masks for pixel perfect collision, the images never change so build them once.
+# Mask.overlap compares whole machine words in C and stops at the first hit,
+# which beats slicing and AND-ing NumPy copies of the masks
+PIPE_TOP_MASK = pygame.mask.from_surface(PIPE_TOP_IMG)
+PIPE_BOTTOM_MASK = pygame.mask.from_surface(PIPE_IMG)
+_BIRD_MASK_CACHE = {id(img): pygame.mask.from_surface(img) for img in BIRD_IMGS}
+
+# Every tilt a bird can have: the starting 0 and the steps from 25 down to -90
+TILTS = [25, 5, 0, -15, -35, -55, -75, -90]
+
+# Bird images rotated once for every tilt, keyed by (image index, tilt)
+PRE_ROT = {(i, t): pygame.transform.rotate(BIRD_IMGS[i], t) for i in range(len(BIRD_IMGS)) for t in TILTS}
+
+# Where to blit each rotated image, relative to the bird's position, so it stays centered
+PRE_ROT_OFFSET = {}
+for key, surf in PRE_ROT.items():
+    orig = BIRD_IMGS[key[0]]
+    PRE_ROT_OFFSET[key] = (orig.get_width()//2 - surf.get_width()//2, orig.get_height()//2 - surf.get_height()//2)
+
+# Image sizes never change, no need to ask pygame every tick
+PIPE_WIDTH = PIPE_IMG.get_width()
+PIPE_HEIGHT = PIPE_IMG.get_height()
+BIRD_WIDTHS = [img.get_width() for img in BIRD_IMGS]
+BIRD_HEIGHTS = [img.get_height() for img in BIRD_IMGS]
+
+
+def convert_images():
+    """
+    Converts the images that get drawn to the pixel format of the
+    window, so blitting them doesn't convert every pixel each frame.
+    Needs a window, call it after pygame.display.set_mode.
+    Only converts the first time it is called
+    """
+    global PIPE_IMG, PIPE_TOP_IMG, BASE_IMG, BG_IMG, PRE_ROT, IMAGES_CONVERTED
+    if IMAGES_CONVERTED:
+        return
+
+    PIPE_IMG = PIPE_IMG.convert_alpha()
+    PIPE_TOP_IMG = PIPE_TOP_IMG.convert_alpha()
+    BASE_IMG = Base.IMG = BASE_IMG.convert()
+    BG_IMG = BG_IMG.convert()
+    PRE_ROT = {key: img.convert_alpha() for key, img in PRE_ROT.items()}
+    IMAGES_CONVERTED = True
+
 
 class Bird:
     """
@@ -55,6 +123,7 @@ class Bird:
         self.velocity = 0
         self.height = self.y
         self.img_count = 0
+        self.img_idx = 0
         self.img = self.IMGS[0] #Bird1.png
 
 
@@ -92,43 +161,54 @@ class Bird:
                 self.tilt = self.MAX_ROTATION
         else: # tilt down
             if self.tilt > -90:
-                self.tilt -= self.ROTATION_VELOCITY
-
+                # Stop right at -90 so the tilt stays one of the TILTS
+                self.tilt = max(self.tilt - self.ROTATION_VELOCITY, -90)
 
-    def draw(self, win):
-        """
-        Draw the bird
-        """
+        # The image is animated here and not in draw, so the collision mask
+        # is the same whether the generation is drawn or not
         self.img_count += 1
 
         # Check what image we should show based on the current image count
         if self.img_count < self.ANIMATION_TIME:
+            self.img_idx = 0
             self.img = self.IMGS[0] #First bird
         elif self.img_count < self.ANIMATION_TIME*2:
+            self.img_idx = 1
             self.img = self.IMGS[1] #Second bird
         elif self.img_count < self.ANIMATION_TIME*3:
+            self.img_idx = 2
             self.img = self.IMGS[2] #Last bird
         elif self.img_count < self.ANIMATION_TIME*4:
+            self.img_idx = 1
             self.img = self.IMGS[1]
         elif self.img_count < self.ANIMATION_TIME*4 + 1:
+            self.img_idx = 0
             self.img = self.IMGS[0]
             self.img_count = 0 #Reset the counter
 
         if self.tilt <= -80:
+            self.img_idx = 1
             self.img = self.IMGS[1]
             self.img_count = self.ANIMATION_TIME * 2
 
+
+    def draw(self, win):
+        """
+        Draw the bird
+        :return: the area of the window that was drawn on
+        """
         # Rotate the image
-        rotated_image = pygame.transform.rotate(self.img, self.tilt)
-        new_rect = rotated_image.get_rect(center=self.img.get_rect(topleft = (self.x, self.y)).center)
-        win.blit(rotated_image, new_rect.topleft)
+        key = (self.img_idx, self.tilt)
+        dx, dy = PRE_ROT_OFFSET[key]
+        # y + 0.5 rounds halves up like pygame.Rect did, blit would just truncate
+        return win.blit(PRE_ROT[key], (self.x + dx, int(self.y + 0.5) + dy))
 
     
     def get_mask(self):
         """
         Gets the mask for the current image of the bird
         """
-        return pygame.mask.from_surface(self.img)
+        return _BIRD_MASK_CACHE[id(self.img)]
 
 
 class Pipe:
@@ -139,26 +219,31 @@ class Pipe:
     VELOCITY = 5
 
 
-    def __init__(self, x):
+    def __init__(self, x, rng=random):
+        # rng -> random generator for the pipe heights
         self.x = x
         self.height = 0
 
         self.top = 0
         self.bottom = 0
-        self.PIPE_TOP = pygame.transform.flip(PIPE_IMG, False, True)
+        self.PIPE_TOP = PIPE_TOP_IMG
         self.PIPE_BOTTOM = PIPE_IMG
+        self.top_height = self.PIPE_TOP.get_height()
+        self.top_mask = PIPE_TOP_MASK
+        self.bottom_mask = PIPE_BOTTOM_MASK
 
         # If the bird passed the pipe
         self.passed = False
-        self.set_height()
+        self.set_height(rng)
 
 
-    def set_height(self):
+    def set_height(self, rng=random):
         """
         Set the height of the pipe, from the top of the screen
+        :param rng: random generator used to pick the height
         """
-        self.height = random.randrange(50, 450)
-        self.top = self.height - self.PIPE_TOP.get_height()
+        self.height = rng.randrange(50, 450)
+        self.top = self.height - self.top_height
         self.bottom = self.height + self.GAP
 
 
@@ -173,30 +258,39 @@ class Pipe:
         """
         Draw both the top and bottom of the pipe
         :param win: pygame window/surface
+        :return: the area of the window that was drawn on
         """
         # draw top
-        win.blit(self.PIPE_TOP, (self.x, self.top))
+        top = win.blit(self.PIPE_TOP, (self.x, self.top))
         # draw bottom
-        win.blit(self.PIPE_BOTTOM, (self.x, self.bottom))
+        bottom = win.blit(self.PIPE_BOTTOM, (self.x, self.bottom))
+        return top.union(bottom)
 
 
     def collide(self, bird):
         """
         Returns if a point is colliding with the pipe
         """
-        bird_mask = bird.get_mask()
-        top_mask =  pygame.mask.from_surface(self.PIPE_TOP)
-        bottom_mask =  pygame.mask.from_surface(self.PIPE_BOTTOM)
+        by = round(bird.y)
 
-        top_offset = (self.x - bird.x, self.top - round(bird.y))
-        bottom_offset = (self.x - bird.x, self.bottom - round(bird.y))
+        # Cheap bounding box test first, the masks only matter when the rects touch
+        bird_rect = pygame.Rect(bird.x, by, BIRD_WIDTHS[bird.img_idx], BIRD_HEIGHTS[bird.img_idx])
+        top_rect = pygame.Rect(self.x, self.top, PIPE_WIDTH, self.top_height)
+        bottom_rect = pygame.Rect(self.x, self.bottom, PIPE_WIDTH, PIPE_HEIGHT)
 
-        b_point = bird_mask.overlap(bottom_mask, bottom_offset)
-        t_point = bird_mask.overlap(top_mask, top_offset)
+        if not bird_rect.colliderect(top_rect) and not bird_rect.colliderect(bottom_rect):
+            return False
 
-        if t_point or b_point:
+        bird_mask = bird.get_mask()
+        off_x = self.x - bird.x
+
+        # No need to test the top pipe when the bottom one already hit
+        if bird_mask.overlap(self.bottom_mask, (off_x, self.bottom - by)):
             return True #We're colliding
-        
+
+        if bird_mask.overlap(self.top_mask, (off_x, self.top - by)):
+            return True
+
         return False
 
 
@@ -230,9 +324,88 @@ class Base:
         """
         Draw the floor. This is two images that move together.
         :param win: the pygame surface/window
+        :return: the area of the window that was drawn on
         """
-        win.blit(self.IMG, (self.x1, self.y))
-        win.blit(self.IMG, (self.x2, self.y))
+        rect1 = win.blit(self.IMG, (self.x1, self.y))
+        rect2 = win.blit(self.IMG, (self.x2, self.y))
+        return rect1.union(rect2)
+
+
+class FlockNetwork:
+    """
+    Evaluates the neural networks of the whole flock at once.
+    Every node of every network gets a column in one value vector
+    and the nodes are grouped by depth, so each depth is a single
+    matrix product instead of one activate() call per bird.
+    Only knows the sum aggregation and tanh activation from the config,
+    any other node function raises ValueError.
+
+    Every depth keeps a dense matrix as wide as all the columns, and every
+    row is computed each tick even for dead birds, so memory and time grow
+    with the square of pop_size. Fine for a few hundred birds, about 19 MB
+    at 1000.
+    """
+
+    def __init__(self, nets):
+        # nets -> list of neat FeedForwardNetwork objects
+        columns = []
+        input_cols = []
+        output_cols = []
+        depths = {}
+
+        for net in nets:
+            col = {}
+            for key in net.input_nodes + net.output_nodes:
+                col[key] = len(columns)
+                columns.append(key)
+            depth = {key: 0 for key in net.input_nodes}
+
+            for node, act_func, agg_func, bias, response, links in net.node_evals:
+                if act_func is not neat.activations.tanh_activation or agg_func is not neat.aggregations.sum_aggregation:
+                    raise ValueError("FlockNetwork only supports tanh activation with sum aggregation, "
+                                     "node {} uses {} and {}".format(node, act_func.__name__, agg_func.__name__))
+                if node not in col:
+                    col[node] = len(columns)
+                    columns.append(node)
+                depth[node] = 1 + max((depth[i] for i, _ in links), default=0)
+                depths.setdefault(depth[node], []).append((col[node], bias, response, [(col[i], w) for i, w in links]))
+
+            input_cols.append([col[key] for key in net.input_nodes])
+            output_cols.append(col[net.output_nodes[0]])
+
+        self.width = len(columns)
+        self.input_cols = np.array(input_cols, dtype=np.intp)
+        self.output_cols = np.array(output_cols, dtype=np.intp)
+
+        # One (cols, weights, bias, response) entry per depth
+        self.layers = []
+        for d in sorted(depths):
+            nodes = depths[d]
+            weights = np.zeros((len(nodes), self.width))
+            for row, (_, _, _, links) in enumerate(nodes):
+                for c, w in links:
+                    weights[row, c] += w
+            self.layers.append((np.array([n[0] for n in nodes], dtype=np.intp),
+                                weights,
+                                np.array([n[1] for n in nodes]),
+                                np.array([n[2] for n in nodes])))
+
+
+    def activate(self, rows, inputs):
+        """
+        Run the networks in rows with the given inputs
+        :param rows: indices of the networks to evaluate
+        :param inputs: array of shape (len(rows), number of inputs)
+        :return: array with the first output of every network in rows
+        """
+        values = np.zeros(self.width)
+        values[self.input_cols[rows]] = inputs
+
+        for cols, weights, bias, response in self.layers:
+            # same as neat's tanh_activation: tanh(2.5 * z)
+            values[cols] = np.tanh(2.5 * (bias + response * (weights @ values)))
+
+        return values[self.output_cols[rows]]
 
 
 def draw_window(win, birds, pipes, base, score, gen):
@@ -245,25 +418,55 @@ def draw_window(win, birds, pipes, base, score, gen):
     :param gen: current generation
     :param pipe_ind: index of closest pipe
     """
-    win.blit(BG_IMG, (0,0))
-
+    # Only the first frame of a generation draws the whole background,
+    # after that just the areas drawn on last frame are cleaned
+    full = getattr(draw_window, "_frame_gen", None) != gen
+    if full:
+        win.blit(BG_IMG, (0,0))
+    else:
+        for rect in draw_window._dirty:
+            win.blit(BG_IMG, rect, rect)
+
+    dirty = []
     for pipe in pipes:
-        pipe.draw(win)
+        dirty.append(pipe.draw(win))
 
-    # 'Score' text
-    text = STAT_FONT.render("Score: " + str(score), 1, (255, 255, 255))
-    win.blit(text, (WIN_WIDTH - 10 - text.get_width(), 10))
+    # 'Score' text, only rendered again when the score changes
+    if getattr(draw_window, "_score", None) != score:
+        draw_window._score_surf = STAT_FONT.render("Score: " + str(score), 1, (255, 255, 255))
+        draw_window._score = score
+    text = draw_window._score_surf
+    dirty.append(win.blit(text, (WIN_WIDTH - 10 - text.get_width(), 10)))
 
     # 'Generations' Text
-    text = STAT_FONT.render("Gen: " + str(gen), 1, (255, 255, 255))
-    win.blit(text, (10,10))
+    if getattr(draw_window, "_gen", None) != gen:
+        draw_window._gen_surf = STAT_FONT.render("Gen: " + str(gen), 1, (255, 255, 255))
+        draw_window._gen = gen
+    dirty.append(win.blit(draw_window._gen_surf, (10,10)))
 
-    base.draw(win)
+    dirty.append(base.draw(win))
 
     for bird in birds:
-        bird.draw(win)
-        
-    pygame.display.update()
+        dirty.append(bird.draw(win))
+
+    if full:
+        pygame.display.update()
+    else:
+        # Old areas to show them cleaned, new ones to show what moved there
+        pygame.display.update(draw_window._dirty + dirty)
+
+    draw_window._dirty = dirty
+    draw_window._frame_gen = gen
+
+
+def genome_key(genome):
+    """
+    Hashable description of everything that changes how a genome plays:
+    its enabled connections with their weights and its nodes' bias and response
+    """
+    connections = tuple(sorted((cg.key, round(cg.weight, 4)) for cg in genome.connections.values() if cg.enabled))
+    nodes = tuple(sorted((ng.key, round(ng.bias, 4), round(ng.response, 4)) for ng in genome.nodes.values()))
+    return connections, nodes
 
 
 # Fitness Function
@@ -273,7 +476,7 @@ def eval_genomes(genomes, config):
     birds and sets their fitness based on the distance they
     reach in the game.
     """
-    global GEN
+    global GEN, TICKS
     GEN += 1
 
     # start by creating lists holding the genome itself, the
@@ -284,34 +487,60 @@ def eval_genomes(genomes, config):
     ge = []
     birds = []
 
+    render = (GEN - 1) % RENDER_EVERY == 0
+
     # Set up a neural network for the genes
     for _, g in genomes:
+        # Already played this course, no need to play it again. Drawn
+        # generations play everyone so the best birds show up on screen
+        fitness = None if render else FITNESS_CACHE.get(genome_key(g))
+        if fitness is not None:
+            g.fitness = fitness
+            continue
+
         net = neat.nn.FeedForwardNetwork.create(g, config)
         nets.append(net)
         birds.append(Bird(230, 350))
         g.fitness = 0
         ge.append(g)
 
+    # All the networks are evaluated together, rows holds the
+    # row of each bird inside the flock network
+    flock = FlockNetwork(nets)
+    rows = list(range(len(nets)))
+    simulated = list(ge)
+
+    # The window and converted images come first, so the pipes pick them up
+    if render:
+        win = pygame.display.set_mode((WIN_WIDTH, WIN_HEIGHT))
+        convert_images()
+        clock = pygame.time.Clock()
+
+    rng = random.Random(PIPE_SEED)
     base = Base(730)
-    pipes = [Pipe(600)]
-    win = pygame.display.set_mode((WIN_WIDTH, WIN_HEIGHT))
-    clock = pygame.time.Clock()
+    pipes = [Pipe(600, rng)]
 
     score = 0
+    bird_width, bird_height = max(BIRD_WIDTHS), max(BIRD_HEIGHTS)
 
     run = True
     while run:
-        clock.tick(30)
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                run = False
-                pygame.quit()
-                quit()
+        TICKS += 1
+        if render:
+            clock.tick(30)
+
+        # Headless generations only check the window now and then to keep it responsive
+        if render or (TICKS % 100 == 0 and pygame.display.get_init()):
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    run = False
+                    pygame.quit()
+                    quit()
         
         # Input to neural network
         pipe_ind = 0
         if len(birds) > 0:
-            if len(pipes) > 1 and birds[0].x > pipes[0].x + pipes[0].PIPE_TOP.get_width():
+            if len(pipes) > 1 and birds[0].x > pipes[0].x + PIPE_WIDTH:
                 pipe_ind = 1
         else:
             run = False
@@ -321,58 +550,140 @@ def eval_genomes(genomes, config):
             bird.move()
             ge[x].fitness += 0.1  
 
-            # Output of the neural network
-            output = nets[x].activate((bird.y, abs(bird.y - pipes[pipe_ind].height), abs(bird.y - pipes[pipe_ind].bottom)))
+        # The target pipe is the same for every bird this tick
+        target_pipe = pipes[pipe_ind]
+        ph, pb = target_pipe.height, target_pipe.bottom
+
+        # Output of the neural networks, one pass for the whole flock
+        ys = np.fromiter((bird.y for bird in birds), dtype=float, count=len(birds))
+        inputs = np.stack([ys, np.abs(ys - ph), np.abs(ys - pb)], axis=1)
+        output = flock.activate(rows, inputs)
 
-            if output[0] > 0.5:
+        for x, bird in enumerate(birds):
+            if output[x] > 0.5:
                 bird.jump()
 
+        # Birds are only marked dead here and removed once at the end of the tick
+        alive = [True] * len(birds)
+
+        # Drop the pipes that are off the screen in a single pass
+        pipes = [pipe for pipe in pipes if pipe.x + PIPE_WIDTH >= 0]
+
+        # Every bird flies at the same x, so each pipe is near all of them or none
+        bird_x = birds[0].x
+
         # Pipes generation
         add_pipe = False
-        rem = []
         for pipe in pipes:
-            for x, bird in enumerate(birds):
-                # if the birds collided
-                if pipe.collide(bird):
-                    # remove 1 from his fitness score
-                    ge[x].fitness -= 1
-                    # get rid of him
-                    birds.pop(x)
-                    nets.pop(x)
-                    ge.pop(x)
-
-                # Check if the bird passed the pipe
-                if not pipe.passed and pipe.x < bird.x:
-                    pipe.passed = True
-                    add_pipe = True
-
-            # If the pipe is off the screen
-            if pipe.x + pipe.PIPE_TOP.get_width() < 0:
-                rem.append(pipe)
+            if pipe.x < bird_x + bird_width and pipe.x + PIPE_WIDTH > bird_x:
+                # Only the birds that stick out of the gap can touch the pipe
+                for x in np.flatnonzero((ys < pipe.height) | (ys + bird_height > pipe.bottom)):
+                    # if the birds collided
+                    if alive[x] and pipe.collide(birds[x]):
+                        # remove 1 from his fitness score
+                        ge[x].fitness -= 1
+                        # get rid of him
+                        alive[x] = False
+
+            # Check if the birds passed the pipe
+            if not pipe.passed and pipe.x < bird_x:
+                pipe.passed = True
+                add_pipe = True
 
             pipe.move()
         
         if add_pipe:
             score += 1
             # Increase the fitness of the bird who gets through the pipe
-            for g in ge:
-                g.fitness += 5
-            pipes.append(Pipe(600))
-
-        for r in rem:
-            pipes.remove(r)
+            for g, a in zip(ge, alive):
+                if a:
+                    g.fitness += 5
+            pipes.append(Pipe(600, rng))
 
         for x, bird in enumerate(birds):
             # If the bird hit the floor or moved up too far
-            if bird.y + bird.img.get_height() > 730 or bird.y < 0:
-                birds.pop(x)
-                nets.pop(x)
-                ge.pop(x)
+            if bird.y + BIRD_HEIGHTS[bird.img_idx] > 730 or bird.y < 0:
+                alive[x] = False
+
+        if not all(alive):
+            birds = [b for b, a in zip(birds, alive) if a]
+            rows = [r for r, a in zip(rows, alive) if a]
+            ge = [g for g, a in zip(ge, alive) if a]
 
         # Base moving
         base.move()
 
-        draw_window(win, birds, pipes, base, score, GEN) 
+        if render:
+            draw_window(win, birds, pipes, base, score, GEN)
+
+        # A bird reached the goal, so neat ends the run after this generation.
+        # Stopping here in both modes keeps the cached fitness the same whether
+        # the generation was drawn or not. Birds still alive all started
+        # together and scored the same, any one will do
+        if ge and ge[0].fitness >= config.fitness_threshold:
+            break
+
+    for g in simulated:
+        FITNESS_CACHE[genome_key(g)] = g.fitness
+
+
+def fast_tanh(z):
+    """
+    Softsign stand in for neat's tanh activation, about twice as
+    cheap in plain Python and close enough for the fitness signal
+    """
+    z = 2.5 * z
+    return z / (1 + abs(z))
+
+
+def eval_genome(genome, config, seed=0):
+    """
+    Runs a headless game with a single bird and returns its
+    fitness. Used by neat.ParallelEvaluator, so it must stay
+    a module level function and never open a window.
+    :param seed: seed of the pipe heights, same course for the whole generation
+    """
+    rng = random.Random(seed)
+    net = neat.nn.FeedForwardNetwork.create(genome, config)
+    bird = Bird(230, 350)
+    pipes = [Pipe(600, rng)]
+    fitness = 0
+
+    # Stop once the bird is good enough, otherwise a perfect bird never ends
+    while fitness < config.fitness_threshold:
+        pipe_ind = 0
+        if len(pipes) > 1 and bird.x > pipes[0].x + PIPE_WIDTH:
+            pipe_ind = 1
+
+        bird.move()
+        fitness += 0.1
+
+        output = net.activate((bird.y, abs(bird.y - pipes[pipe_ind].height), abs(bird.y - pipes[pipe_ind].bottom)))
+        if output[0] > 0.5:
+            bird.jump()
+
+        pipes = [pipe for pipe in pipes if pipe.x + PIPE_WIDTH >= 0]
+
+        add_pipe = False
+        for pipe in pipes:
+            if pipe.collide(bird):
+                return fitness - 1
+
+            if not pipe.passed and pipe.x < bird.x:
+                pipe.passed = True
+                add_pipe = True
+
+            pipe.move()
+
+        if add_pipe:
+            fitness += 5
+            pipes.append(Pipe(600, rng))
+
+        # If the bird hit the floor or moved up too far
+        if bird.y + BIRD_HEIGHTS[bird.img_idx] > 730 or bird.y < 0:
+            break
+
+    return fitness
 
 
 def run(config_path):
@@ -390,8 +701,24 @@ def run(config_path):
     stats = neat.StatisticsReporter()
     population.add_reporter(stats)
 
-    # Run for up to 50 generations
-    winner = population.run(eval_genomes,50)
+    if PARALLEL:
+        # Every genome is activated one node at a time here, so use the cheaper
+        # activation. The flock network keeps the real tanh, np.tanh is already fast
+        config.genome_config.add_activation("tanh", fast_tanh)
+        evaluator = neat.ParallelEvaluator(max(1, os.cpu_count() - 1), eval_genome)
+
+        def eval_parallel(genomes, config):
+            global GEN
+            GEN += 1
+            # New pipe course every generation, shared by all the genomes
+            evaluator.eval_function = functools.partial(eval_genome, seed=GEN)
+            evaluator.evaluate(genomes, config)
+
+        # Run for up to 50 generations
+        winner = population.run(eval_parallel, 50)
+    else:
+        # Run for up to 50 generations
+        winner = population.run(eval_genomes,50)
 
 if __name__ == "__main__":
     # Determine path to configuration file